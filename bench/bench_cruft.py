@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+'''Benchmark the stages of cruft.py report and list.
+
+Runs the given subcommand once with a cold cache and then --warm_runs times
+with a warm cache, all in one process. Stage timings include nested stages
+(eg, collect_portage_objects includes collect_ignore_patterns when patterns
+are not collected yet) and are recorded per root. Several roots are scanned
+in parallel, so their stage times overlap and each can come close to the
+total. The cold run removes the cache of the benchmarked roots, warm runs
+which had to collect portage or pattern data again are marked with !
+(cache_hit in the results). --compare refuses results of another
+subcommand, root set or options. Use a synthetic root from
+bench/gen_root.py:
+    bench/gen_root.py -o /tmp/cruft_bench
+    bench/bench_cruft.py report -q -r /tmp/cruft_bench/root -i /tmp/cruft_bench/cruft.d --results new.json
+    bench/bench_cruft.py report -q -r /tmp/cruft_bench/root -i /tmp/cruft_bench/cruft.d --compare new.json
+'''
+
+import asyncio
+import datetime
+import functools
+import json
+import os
+import platform
+import sys
+import time
+
+# run from a source checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cruft
+import pylon
+
+benchmarked = ('report', 'list')
+# do not affect the benchmarked work
+bench_options = ('--warm_runs', '--results', '--compare')
+stages = ('collect_cached_data',
+          'collect_ignore_patterns',
+          'collect_portage_objects',
+          'collect_system_objects',
+          'collect_cruft_objects')
+
+class bench_cruft(cruft.cruft):
+    __doc__ = sys.modules[__name__].__doc__
+
+    def __init__(self):
+        super().__init__()
+        # subparsers already copied parser_common, add benchmark options to the benchmarked subcommands
+        for subcommand in benchmarked:
+            parser = getattr(self, 'parser_' + subcommand)
+            parser.add_argument('--warm_runs', type=int, default=1,
+                                help='number of runs with a warm cache (default: 1)')
+            parser.add_argument('--results',
+                                help='write machine-readable results to this JSON file')
+            parser.add_argument('--compare',
+                                help='compare with the results of a previous run')
+
+        # time every stage per root, the collectors call each other through self
+        self._timings = dict()
+        for stage in stages:
+            setattr(self, stage, self.timed(stage, getattr(self, stage)))
+
+    def timed(self, stage, func):
+        @functools.wraps(func)
+        async def wrapper(root, *args, **kwargs):
+            t1 = time.perf_counter()
+            try:
+                return await func(root, *args, **kwargs)
+            finally:
+                timings = self._timings.setdefault(root.path, dict())
+                timings[stage] = timings.get(stage, 0) + time.perf_counter() - t1
+        return wrapper
+
+    async def bench_run(self, cache):
+        # fresh per run state, like a new invocation
+        self._text_patterns = dict()
+        self._roots = [cruft.scan_root(x, self.hostname) for x in (self.args.roots or ['/'])]
+        if cache == 'cold':
+            for root in self.roots:
+                for path in (root.cache_path, root.stats_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        self._timings = dict()
+        t1 = time.perf_counter()
+        await getattr(self, self.args.subcommand)()
+        total = time.perf_counter() - t1
+        self.flush_output()
+        # a warm run only measures the cache when nothing had to be collected again
+        cache_hit = not any('collect_portage_objects' in x or 'collect_ignore_patterns' in x for x in self._timings.values())
+        if cache == 'warm' and not cache_hit:
+            self.logger.warning('Cache not hit in a warm run, portage db or pattern files changed')
+        return {'cache': cache,
+                'cache_hit': cache_hit,
+                'total': total,
+                'stages': self._timings}
+
+    def compared_argv(self, argv):
+        'argv without the options of the benchmark itself, equal for comparable runs'
+        compared = list()
+        skip = False
+        for arg in argv:
+            if skip:
+                skip = False
+            elif arg in bench_options:
+                skip = True
+            elif arg.split('=', 1)[0] not in bench_options:
+                compared.append(arg)
+        return compared
+
+    def log_results(self, results, previous=None):
+        lines = list()
+        for idx, run in enumerate(results['runs']):
+            previous_run = previous['runs'][idx] if previous and idx < len(previous['runs']) else None
+            # mark warm runs which missed the cache
+            cache = run['cache'] + ('!' if run['cache'] == 'warm' and not run.get('cache_hit', True) else '')
+            durations = [('total', None, run['total'])]
+            for root_path, timings in sorted(run['stages'].items()):
+                durations += [(stage, root_path, duration) for stage, duration in sorted(timings.items())]
+            labels = [stage if root_path is None or len(run['stages']) == 1 else f'{root_path}: {stage}'
+                      for stage, root_path, _ in durations]
+            width = max(24, *map(len, labels))
+            for label, (stage, root_path, duration) in zip(labels, durations):
+                line = f'{cache:5} {label:{width}} {duration:9.3f}s'
+                if previous_run is not None:
+                    old = previous_run['total'] if root_path is None else previous_run['stages'].get(root_path, dict()).get(stage)
+                    if old:
+                        line += f' (was {old:.3f}s, {100 * (duration - old) / old:+.1f}%)'
+                lines.append(line)
+        self.logger.warning('Benchmark results:' + os.linesep + os.linesep.join(lines))
+
+    async def run_core(self):
+        if self.args.subcommand not in benchmarked:
+            raise pylon.script_error(f'only {", ".join(benchmarked)} can be benchmarked')
+        setup = {'subcommand': self.args.subcommand,
+                 'options': self.compared_argv(sys.argv[1:]),
+                 'root_paths': [root.path for root in self.roots]}
+        previous = None
+        if self.args.compare:
+            with open(self.args.compare, 'r') as f:
+                previous = json.load(f)
+            for key, value in setup.items():
+                if previous.get(key) != value:
+                    raise pylon.script_error(f'{self.args.compare} is not comparable, {key} differs: {previous.get(key)} != {value}')
+
+        runs = [await self.bench_run('cold')]
+        for _ in range(self.args.warm_runs):
+            runs.append(await self.bench_run('warm'))
+
+        results = {'time': datetime.datetime.now().isoformat(),
+                   'host': self.hostname,
+                   'python': platform.python_version(),
+                   'argv': sys.argv[1:],
+                   **setup,
+                   'roots': dict(),
+                   'runs': runs}
+        # describe synthetic roots by their generator settings
+        for root in self.roots:
+            gen_path = os.path.join(os.path.dirname(root.path), 'gen_root.json')
+            if os.path.exists(gen_path):
+                with open(gen_path, 'r') as f:
+                    results['roots'][root.path] = json.load(f)
+
+        self.log_results(results, previous)
+
+        if self.args.results:
+            with open(self.args.results, 'w') as f:
+                json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    app = bench_cruft()
+    asyncio.run(app.run())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+'''Benchmark the pylon logging/output pipeline.
+
+Logs a number of debug lines (plus the same amount of print lines) from the
+main task and from parallel tasks, output should be redirected, eg:
+    bench/bench_logging.py -v -n 100000 > /dev/null 2> /tmp/bench_logging.txt
+timings are reported on stderr once all output is written.
+'''
+
+import asyncio
+import os
+import sys
+import time
+
+# run from a source checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pylon
+
+class bench_logging(pylon.base_cli.base_cli):
+    __doc__ = sys.modules[__name__].__doc__
+
+    def __init__(self):
+        super().__init__()
+        self.parser.add_argument('-n', '--lines', type=int, default=100000,
+                                 help='number of lines to log (default: 100000)')
+        self.parser.add_argument('-t', '--tasks', type=int, default=4,
+                                 help='number of parallel tasks for the prefixed run (default: 4)')
+
+    async def log_lines(self, n):
+        for idx in range(n):
+            self.logger.debug(f'Installed: cat/pkg-{idx}')
+            print(f'^/some/pattern/{idx}$')
+            # let other tasks interleave, like pattern scripts and walkers do
+            if idx % 1000 == 0:
+                await asyncio.sleep(0)
+
+    async def run_core(self):
+        timings = list()
+
+        t1 = time.perf_counter()
+        await self.log_lines(self.args.lines)
+        self.flush_output()
+        timings.append(('main task', time.perf_counter() - t1))
+
+        t1 = time.perf_counter()
+        await self.dispatch_group({'task': self.log_lines(self.args.lines // self.args.tasks), 'name': f'task{idx}'}
+                                  for idx in range(self.args.tasks))
+        self.flush_output()
+        timings.append((f'{self.args.tasks} prefixed tasks', time.perf_counter() - t1))
+
+        for name, duration in timings:
+            sys.__stderr__.write(f'{name}: {2 * self.args.lines} lines in {duration:.3f}s '
+                                 f'({2 * self.args.lines / duration:.0f} lines/s)' + os.linesep)
+
+if __name__ == '__main__':
+    app = bench_logging()
+    asyncio.run(app.run())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+'''Generate a synthetic gentoo root for cruft.py benchmarks.
+
+The generated directory contains
+- root/: an EROOT with N packages owning M files in total, a given ratio of
+    symlinks and cruft files and a fake /var/db/pkg with CONTENTS
+- cruft.d/: a sample pattern root with plain pattern files, package
+    specific pattern files and a pattern script using $ROOT
+
+Everything is derived from --seed, so equal arguments give equal trees:
+    bench/gen_root.py -o /tmp/cruft_bench -n 500 -m 50000
+    bench/bench_cruft.py report -r /tmp/cruft_bench/root -i /tmp/cruft_bench/cruft.d
+'''
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+
+# run from a source checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pylon
+
+categories = ('app-misc', 'dev-libs', 'media-libs', 'net-misc', 'sys-apps', 'x11-libs')
+# owned by the base package, everything else lives below
+base_dirs = ('/etc', '/opt', '/usr', '/usr/bin', '/usr/lib64', '/usr/share', '/var', '/var/db', '/var/lib')
+vdb_path = 'var/db/pkg'
+# fixed mtime, keeps CONTENTS and file stats reproducible
+mtime = 1700000000
+
+class gen_root(pylon.base_cli.base_cli):
+    __doc__ = sys.modules[__name__].__doc__
+
+    def __init__(self):
+        super().__init__()
+        self.parser.add_argument('-o', '--output', default='/tmp/cruft_bench',
+                                 help='output directory, replaced if it exists (default: /tmp/cruft_bench)')
+        self.parser.add_argument('-n', '--packages', type=int, default=500,
+                                 help='number of installed packages (default: 500)')
+        self.parser.add_argument('-m', '--files', type=int, default=50000,
+                                 help='number of files owned by all packages (default: 50000)')
+        self.parser.add_argument('--symlink_ratio', type=float, default=0.1,
+                                 help='ratio of package files installed as symlinks (default: 0.1)')
+        self.parser.add_argument('--cruft_ratio', type=float, default=0.05,
+                                 help='ratio of cruft files compared to package files (default: 0.05)')
+        self.parser.add_argument('--seed', type=int, default=0,
+                                 help='random seed (default: 0)')
+
+    def write_file(self, path, content=''):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def install(self, root, cpv, contents):
+        'create the objects of a package and its vdb entry, contents is a list of (type, path, data)'
+        lines = list()
+        for obj_type, path, data in contents:
+            host_path = os.path.join(root, path.lstrip('/'))
+            if obj_type == 'dir':
+                os.makedirs(host_path, exist_ok=True)
+                lines.append(f'dir {path}')
+            elif obj_type == 'obj':
+                self.write_file(host_path, data)
+                lines.append(f'obj {path} {hashlib.md5(data.encode()).hexdigest()} {mtime}')
+            elif obj_type == 'sym':
+                os.makedirs(os.path.dirname(host_path), exist_ok=True)
+                os.symlink(data, host_path)
+                os.utime(host_path, (mtime, mtime), follow_symlinks=False)
+                lines.append(f'sym {path} -> {data} {mtime}')
+
+        vdb_dir = os.path.join(root, vdb_path, cpv)
+        for name, value in (('CONTENTS', os.linesep.join(lines) + os.linesep),
+                            ('SLOT', '0' + os.linesep),
+                            ('EAPI', '8' + os.linesep),
+                            ('COUNTER', str(self._counter) + os.linesep),
+                            ('repository', 'gentoo' + os.linesep)):
+            self.write_file(os.path.join(vdb_dir, name), value)
+        self._counter += 1
+
+    def generate_root(self, root, rnd):
+        'returns the installed cpvs'
+        self._counter = 1
+        self.install(root, 'sys-apps/baselayout-2.14', [('dir', x, None) for x in base_dirs])
+
+        # spread files over the packages, at least one each
+        n_files = [1] * self.args.packages
+        for _ in range(max(self.args.files - self.args.packages, 0)):
+            n_files[rnd.randrange(self.args.packages)] += 1
+
+        cpvs = list()
+        package_dirs = list()
+        for idx, n in enumerate(n_files):
+            cat = categories[idx % len(categories)]
+            name = f'pkg{idx}'
+            cpv = f'{cat}/{name}-1.{idx % 10}'
+            share = f'/usr/share/{name}'
+            contents = [('dir', share, None), ('dir', f'{share}/data', None)]
+            for file_idx in range(n):
+                path = f'{share}/data/file{file_idx}'
+                # the first file is the symlink target of the others
+                if file_idx and rnd.random() < self.args.symlink_ratio:
+                    contents.append(('sym', path, 'file0'))
+                else:
+                    contents.append(('obj', path, f'{cpv} {file_idx}' + os.linesep))
+            contents.append(('obj', f'/usr/bin/{name}', '#!/bin/sh' + os.linesep))
+            self.install(root, cpv, contents)
+            cpvs.append(cpv)
+            package_dirs.append(f'{share}/data')
+
+        # cruft: stray files in package dirs, leftover config and a subtree portage knows nothing about
+        n_cruft = int(self.args.files * self.args.cruft_ratio)
+        for idx in range(n_cruft):
+            kind = rnd.random()
+            if kind < 0.5:
+                path = f'{rnd.choice(package_dirs)}/stray{idx}'
+            elif kind < 0.6:
+                path = f'/etc/stray{idx}.conf'
+            elif kind < 0.7:
+                path = f'/opt/ignored/stray{idx}'
+            else:
+                path = f'/opt/vendor/lib{idx % 10}/stray{idx}'
+            self.write_file(os.path.join(root, path.lstrip('/')), f'{idx}' + os.linesep)
+        return cpvs
+
+    def generate_patterns(self, pattern_root, cpvs, rnd):
+        self.write_file(os.path.join(pattern_root, '00base'),
+                        '# not covered by packages' + os.linesep +
+                        '^/var/db/pkg$' + os.linesep +
+                        '^/etc/stray1[0-9]*\\.conf$' + os.linesep)
+
+        # package specific patterns, only used when the package is installed
+        for cpv in rnd.sample(cpvs, max(len(cpvs) // 10, 1)):
+            cat, pf = cpv.split('/')
+            name = pf.rsplit('-', 1)[0]
+            self.write_file(os.path.join(pattern_root, cat, name),
+                            f'^/usr/share/{name}/data/stray[0-9]*$' + os.linesep)
+        # not installed
+        self.write_file(os.path.join(pattern_root, 'sys-apps', 'not-installed'), '^/nowhere$' + os.linesep)
+
+        # pattern script, run for every root
+        script = os.path.join(pattern_root, '01script')
+        self.write_file(script,
+                        '#!/bin/sh' + os.linesep +
+                        'echo ^/opt/ignored$' + os.linesep +
+                        'ls -1 "$ROOT"/usr/bin | sed "s/\\(.*\\)/^\\/usr\\/bin\\/\\1-old$/"' + os.linesep)
+        os.chmod(script, 0o755)
+
+    async def run_core(self):
+        rnd = random.Random(self.args.seed)
+        if os.path.exists(self.args.output):
+            # never wipe a directory we did not generate
+            if os.listdir(self.args.output) and not os.path.exists(os.path.join(self.args.output, 'gen_root.json')):
+                raise pylon.script_error(f'not a generated root, refusing to replace: {self.args.output}')
+            shutil.rmtree(self.args.output)
+        root = os.path.join(self.args.output, 'root')
+        pattern_root = os.path.join(self.args.output, 'cruft.d')
+
+        self.logger.info(f'Generating synthetic root {root}...')
+        cpvs = self.generate_root(root, rnd)
+        self.logger.info(f'Generating pattern root {pattern_root}...')
+        self.generate_patterns(pattern_root, cpvs, rnd)
+
+        # remember the generator settings for benchmark results
+        with open(os.path.join(self.args.output, 'gen_root.json'), 'w') as f:
+            json.dump({k: getattr(self.args, k) for k in ('packages', 'files', 'symlink_ratio', 'cruft_ratio', 'seed')},
+                      f, indent=2)
+
+if __name__ == '__main__':
+    app = gen_root()
+    asyncio.run(app.run())
@@ -12,6 +12,37 @@ http://forums.gentoo.org/viewtopic-t-152618-postdays-0-postorder-asc-start-0.htm
 - pattern/portage data is cached, system tree is always scanned.
     restrict system tree with -p option for faster debugging
 
+- report --diff only lists cruft added or removed since the last snapshot
+    (or with a changed modification date), the last snapshots are kept
+    next to the cache, separately for each -p path, --aggregate and
+    --fs_types mode.
+
+- the system tree walk reads the mount table once, skips pseudo filesystems
+    (and with --fs_types every filesystem type not listed) and walks each
+    remaining mount in a parallel worker.
+
+- report --aggregate does not descend into directories portage owns nothing
+    in, but reports them as one entry with file count, size and newest
+    modification date (--aggregate_depth levels below are still listed).
+    dirs containing ignored paths are listed as usual, their subdirs are
+    still aggregated.
+
+- --low_impact runs with idle I/O priority and lowest CPU priority (inherited
+    by pattern scripts), limits walked dirs and --check hashed bytes per
+    second, backs off while the load average is high and logs progress with
+    an ETA based on the previous walk in the same mode.
+
+- query the owning package of many paths at once (cruft.py owner < paths),
+    paths not owned by portage are reported as ignored (with pattern and
+    pattern file) or as cruft. like in report, dirs containing ignored paths
+    are not cruft.
+
+- multiple roots (chroots, container images) can be scanned in one run by
+    repeating the -r option. roots are scanned in parallel, each with its own
+    portage db and cache. pattern scripts see the scanned root in $ROOT and
+    read their files below it instead of querying host tools. symlinks inside
+    a root are resolved inside that root.
+
 ====================================================================
 FIXME
 - pkgcore might provide faster portage db operations, but it's a dependency (pkgcore/pkgdev seem to be new gentoo dev approved tools)
@@ -47,13 +78,17 @@ FIXME
 '''
 
 import asyncio
+import contextlib
+import datetime
 import functools
+import glob
 import hashlib
 import io
 import os
 import pickle
 import pylon
 import re
+import stat
 import sys
 import time
 import portage
@@ -62,13 +97,109 @@ import gentoolkit.equery.check
 # FIXME configurability (use TOML? https://docs.python.org/3/library/tomllib.html#module-tomllib)
 cache_base_path = '/tmp'
 cache_base_name = 'cruft_cache'
+snapshot_base_name = 'cruft_snapshot'
+stats_base_name = 'cruft_stats'
+# bump whenever the layout of the cached data changes
+cache_format = 3
 comment_char = '#'
 default_pattern_root = '/usr/bin/cruft.d'
+# low impact mode
+load_check_interval = 1
+load_backoff = 5
+progress_interval = 60
+mountinfo_path = '/proc/self/mountinfo'
+# virtual filesystems never contain cruft, do not walk them
+pseudo_fs_types = {'autofs', 'binfmt_misc', 'bpf', 'cgroup', 'cgroup2', 'configfs', 'debugfs', 'devpts',
+                   'devtmpfs', 'efivarfs', 'fusectl', 'hugetlbfs', 'mqueue', 'nsfs', 'proc', 'pstore',
+                   'ramfs', 'rpc_pipefs', 'securityfs', 'selinuxfs', 'sysfs', 'tmpfs', 'tracefs'}
 
 gtk_check = gentoolkit.equery.check.VerifyContents()
-trees = portage.create_trees()
-vardb = trees[portage.settings['EROOT']]["vartree"].dbapi
-vardb_path = os.path.join(portage.settings['EROOT'], portage.const.VDB_PATH)
+
+class scan_root():
+    'portage db, cache location and collected data of a single root'
+
+    @property
+    def path(self):
+        return self._path
+    @property
+    def vardb(self):
+        return self._vardb
+    @property
+    def vardb_path(self):
+        return self._vardb_path
+    @property
+    def cache_path(self):
+        return self._cache_path
+    @property
+    def snapshot_prefix(self):
+        return self._snapshot_prefix
+    @property
+    def stats_path(self):
+        return self._stats_path
+
+    def __init__(self, _path, _hostname):
+        _path = os.path.realpath(_path)
+        self.__dict__.update(locals())
+        trees = portage.create_trees(target_root=_path)
+        eroot = trees._target_eroot
+        self._vardb = trees[eroot]['vartree'].dbapi
+        self._vardb_path = os.path.join(eroot, portage.const.VDB_PATH)
+
+        # keep the historic cache name for the running system
+        suffix = '_' + _hostname
+        if _path != '/':
+            # readable, the hash keeps eg /srv/chroot_a and /srv/chroot/a apart
+            suffix += _path.replace('/', '_') + '_' + hashlib.md5(_path.encode('utf-8')).hexdigest()[:8]
+        self._cache_path = os.path.join(cache_base_path, cache_base_name + suffix)
+        self._snapshot_prefix = os.path.join(cache_base_path, snapshot_base_name + suffix)
+        self._stats_path = os.path.join(cache_base_path, stats_base_name + suffix)
+        self.data = dict()
+        self.aggregated = dict()
+        # set when processing the root failed, it is skipped for the rest of the run
+        self.failed = False
+        # resolved dirnames, CONTENTS lists the same dirs over and over
+        self._realpaths = dict()
+
+    def host_path(self, path):
+        'translate a path inside this root into a path on the running system'
+        return os.path.join(self.path, path.lstrip('/'))
+
+    def root_path(self, host_path):
+        'translate a path on the running system into a path inside this root'
+        if self.path == '/':
+            return host_path
+        rel_path = os.path.relpath(host_path, self.path)
+        return '/' if rel_path == '.' else '/' + rel_path
+
+    def realpath(self, path):
+        'resolve symlinks in a path inside this root, absolute link targets are resolved inside the root as well'
+        if path in self._realpaths:
+            return self._realpaths[path]
+        if self.path == '/':
+            self._realpaths[path] = os.path.realpath(path)
+            return self._realpaths[path]
+        resolved = '/'
+        parts = [x for x in path.split('/') if x]
+        n_links = 0
+        while parts:
+            part = parts.pop(0)
+            if part == '.':
+                continue
+            if part == '..':
+                resolved = os.path.dirname(resolved)
+                continue
+            candidate = os.path.join(resolved, part)
+            # FIXME symlink loops are cut off like the kernel does (ELOOP), the rest is kept unresolved
+            if n_links < 40 and os.path.islink(self.host_path(candidate)):
+                n_links += 1
+                target = os.readlink(self.host_path(candidate))
+                if target.startswith('/'):
+                    resolved = '/'
+                parts = [x for x in target.split('/') if x] + parts
+            else:
+                resolved = candidate
+        self._realpaths[path] = resolved
+        return resolved
 
 class cruft(pylon.gentoo_cli.gentoo_cli):
     __doc__ = sys.modules[__name__].__doc__
@@ -78,6 +209,16 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
         self.parser_common.add_argument('-i', '--pattern_root',
                                         default=default_pattern_root,
                                         help='give alternative path to directory containing ignore pattern files')
+        self.parser_common.add_argument('--low_impact', action='store_true',
+                                        help='throttle I/O and CPU usage for busy production hosts')
+        self.parser_common.add_argument('--max_dirs', type=float, default=500,
+                                        help='low impact mode: walked directories per second (default: 500)')
+        self.parser_common.add_argument('--max_hash_rate', type=float, default=16 * 1024 * 1024,
+                                        help='low impact mode: bytes per second hashed by --check (default: 16 MiB)')
+        self.parser_common.add_argument('--max_load', type=float, default=os.cpu_count(),
+                                        help='low impact mode: pause while the 1 min load average is above (default: nr of cpus)')
+        self.parser_common.add_argument('-r', '--root', action='append', dest='roots',
+                                        help='scan a chroot or container root instead of / (repeat for several roots)')
         self.init_subcommands()
         self.parser_report.add_argument('-c', '--check', action='store_true',
                                         help='perform gentoolkit sanity checks on all installed packages (time consuming!)')
@@ -89,26 +230,77 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
                                         help='date: report cruft objects sorted by modification date, '
                                         'path: report cruft objects sorted by object path (default), '
                                         'rm_chain: report cruft objects as chained rm commands')
+        self.parser_report.add_argument('--fs_types', nargs='+',
+                                        help='walk only mounts of these filesystem types (eg, ext4 btrfs), '
+                                        'pseudo filesystems are always skipped')
+        self.parser_report.add_argument('-a', '--aggregate', action='store_true',
+                                        help='report directories without any portage objects as one entry')
+        self.parser_report.add_argument('--aggregate_depth', type=int, default=0,
+                                        help='list objects this many levels deep inside aggregated directories (default: 0)')
+        self.parser_report.add_argument('-d', '--diff', action='store_true',
+                                        help='report only changes since the last snapshot of cruft objects')
+        self.parser_report.add_argument('--keep_snapshots', type=int, default=7,
+                                        help='number of cruft snapshots to keep for --diff (default: 7)')
+        self.parser_owner.add_argument('paths', nargs='*',
+                                       help='paths to look up (default: read one path per line from stdin)')
+
+    @property
+    def roots(self):
+        # just return None before setup
+        return getattr(self, '_roots', None)
 
-    def ignored(self, path):
+    def ignored(self, root, path):
         'check if a path matches the ignore pattern regex.'
-        return self.data['patterns']['single_regex'].match(path)
+        return root.data['patterns']['single_regex'].match(path)
+
+    def extract_patterns(self, pattern_file, re_list_raw):
+        'split raw pattern lines into regexes and drop invalid ones'
+        # - strip all metachars
+        # - interpret spaces as delimiter for multiple patterns
+        #   on one line. needed for automatic bash expansion by
+        #   {}. however this breaks ignore patterns with spaces!
+        # FIXME
+        re_list_of_file = pylon.flatten(x.strip().split() for x in re_list_raw)
+
+        # pattern sanity checks, to facilitate pattern file debugging
+        re_list = list()
+        for regex in re_list_of_file:
+            try:
+                re.compile(regex)
+            except Exception:
+                self.logger.error(f'Skipped invalid expression in {pattern_file} ({regex})')
+            else:
+                re_list.append(regex)
+        return re_list
+
+    def read_pattern_file(self, pattern_file):
+        'read regexes from a plain pattern file, only once per run since they do not depend on the root'
+        if pattern_file not in self._text_patterns:
+            re_list_raw = list()
+            with open(pattern_file, 'r') as f:
+                for line in f:
+                    # ignore comment lines
+                    comment_idx = line.find(comment_char)
+                    line_no_comments = line if comment_idx == -1 else line[:comment_idx]
+                    re_list_raw.append(line_no_comments)
+            self._text_patterns[pattern_file] = self.extract_patterns(pattern_file, re_list_raw)
+        return self._text_patterns[pattern_file]
 
-    async def collect_ignore_patterns(self):
+    async def collect_ignore_patterns(self, root):
         self.logger.info('Collecting ignore patterns...')
         
         pattern_files = list()
-        for root, dirs, files in os.walk(self.args.pattern_root):
+        for dirpath, dirs, files in os.walk(self.args.pattern_root):
             for f in files:
                 # assume leaf dirs contain package-specific patterns
                 if not dirs:
                     # check if any version of the package is installed
-                    pkg = os.path.join(os.path.basename(root), f)
-                    if not vardb.match(pkg):
+                    pkg = os.path.join(os.path.basename(dirpath), f)
+                    if not root.vardb.match(pkg):
                         self.logger.debug('Not installed: ' + pkg)
                         continue
                     self.logger.debug('Installed: ' + pkg)
-                pattern_files.append(os.path.join(root, f))
+                pattern_files.append(os.path.join(dirpath, f))
 
         re_map = dict()
         
@@ -116,41 +308,25 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
             self.logger.debug('Extracting patterns from: ' + pattern_file)
             
             # either we generate regexes from executable scripts, ...
-            re_list_raw = list()
             if os.access(pattern_file, os.X_OK):
+                re_list_raw = list()
                 try:
                     out = io.StringIO()
-                    await self.dispatch(pattern_file, output=(None, out))
+                    await self.dispatch(pattern_file, output=(None, out),
+                                        env=dict(os.environ, ROOT=root.path))
                     # FIXME
                     re_list_raw = out.getvalue().splitlines()
                 except pylon.script_error:
                     self.logger.error('Script failed: ' + pattern_file)
+                re_list_of_file = self.extract_patterns(pattern_file, re_list_raw)
                     
             # ... or we simply read in lines from a text file
             else:
-                with open(pattern_file, 'r') as f:
-                    for line in f:
-                        # ignore comment lines
-                        comment_idx = line.find(comment_char)
-                        line_no_comments = line if comment_idx == -1 else line[:comment_idx]
-                        re_list_raw.append(line_no_comments)
-                        
-            # - strip all metachars
-            # - interpret spaces as delimiter for multiple patterns
-            #   on one line. needed for automatic bash expansion by
-            #   {}. however this breaks ignore patterns with spaces!
-            # FIXME
-            re_list_of_file = pylon.flatten(x.strip().split() for x in re_list_raw)
-
-            # pattern sanity checks, to facilitate pattern file debugging
+                re_list_of_file = self.read_pattern_file(pattern_file)
+
+            # even if patterns are listed redundantly in one file, just add it once
             for regex in re_list_of_file:
-                try:
-                    re.compile(regex)
-                except Exception:
-                    self.logger.error(f'Skipped invalid expression in {pattern_file} ({regex})')
-                else:
-                    # even if patterns are listed redundantly in one file, just add it once
-                    re_map.setdefault(regex, set()).add(pattern_file)
+                re_map.setdefault(regex, set()).add(pattern_file)
                     
         self.logger.debug('Compiling all expressions into one long regex...')
         re_single_regex = re.compile('|'.join(re_map.keys()))
@@ -158,183 +334,553 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
         return {'map': re_map,
                 'single_regex': re_single_regex}
 
-    async def collect_portage_objects(self):
-        if 'patterns' not in self.data:
-            self.data['patterns'] = await self.collect_ignore_patterns()
+    async def collect_portage_objects(self, root):
+        if 'patterns' not in root.data:
+            root.data['patterns'] = await self.collect_ignore_patterns(root)
             
         self.logger.info('Collecting objects managed by portage...')
-        objects = set()
-        for pkg in sorted(vardb.cpv_all()):
-            contents = vardb._dblink(pkg).getcontents()
+        # map each object to its owning packages, doubles as index for owner queries
+        objects = dict()
+        for pkg in sorted(root.vardb.cpv_all()):
+            contents = root.vardb._dblink(pkg).getcontents()
             
             check = dict()
             for k, v in contents.items():
                 
                 # just flatten out the dirname part to avoid tinkering with symlinks introduced by portage itself.
-                k = os.path.join(os.path.realpath(os.path.dirname(k)), os.path.basename(k))
+                k = os.path.join(root.realpath(os.path.dirname(k)), os.path.basename(k))
                 
                 # add trailing slashes to directories for easier regex matching
                 if v[0] == 'dir':
                     k += '/'
                     
-                objects.add(k)
-                check[k] = v
+                # shared dirs are owned by several packages
+                objects.setdefault(k, []).append(pkg)
+                check[root.host_path(k)] = v
                 
             # implicitly checks for missing portage objects
             if self.args.check:
+                if self._hash_bucket is not None:
+                    n_bytes = 0
+                    for path, v in check.items():
+                        if v[0] == 'obj':
+                            with contextlib.suppress(OSError):
+                                n_bytes += os.lstat(path).st_size
+                    await asyncio.sleep(self.throttle(self._hash_bucket, n_bytes))
                 n_passed, n_checked, errs = gtk_check._run_checks(check)
                 for err in errs:
-                    path = err.split()[0]
-                    if not self.ignored(path) and path.startswith(self.args.path):
+                    path = root.root_path(err.split()[0])
+                    if not self.ignored(root, path) and path.startswith(self.args.path):
                         self.logger.error(pkg + ': ' + err)
+
+            # let the other roots proceed in between packages
+            await asyncio.sleep(0)
                         
         return objects
 
-    async def collect_system_objects(self):
-        """Collect all objects in the system tree."""
-        if 'patterns' not in self.data:
-            self.data['patterns'] = await self.collect_ignore_patterns()
-            
-        self.logger.info('Collecting objects in system tree...')
+    def throttle(self, bucket, n=1):
+        'seconds to wait before processing n units of a rate limited resource (0 outside low impact mode)'
+        if bucket is None:
+            return 0
+        delay = bucket.delay(n)
+        # getloadavg reads /proc, do not query it for every single directory
+        now = time.monotonic()
+        if now - self._load_stamp > load_check_interval:
+            self._load_stamp = now
+            self._overloaded = os.getloadavg()[0] > self.args.max_load
+        if self._overloaded:
+            delay = max(delay, load_backoff)
+        return delay
+
+    def read_mountinfo(self):
+        'map mount points to their filesystem type, empty without a mounted /proc (eg, in a chroot)'
+        mounts = dict()
+        try:
+            with open(mountinfo_path, 'r') as f:
+                for line in f:
+                    fields = line.split()
+                    # mount point is the 5th field, fs type follows the optional fields separator
+                    mount_point = re.sub(r'\\([0-7]{3})', lambda x: chr(int(x.group(1), 8)), fields[4])
+                    mounts[mount_point] = fields[fields.index('-') + 1]
+        except OSError as e:
+            self.logger.warning(f'Could not read mount table => walking without mount awareness: {e}')
+        return mounts
+
+    def walked(self, fs_type):
+        'check if mounts of a filesystem type are walked'
+        if fs_type in pseudo_fs_types:
+            return False
+        return not self.args.fs_types or fs_type in self.args.fs_types
+
+    def walk_tops(self, root):
+        'determine the walk start of every mount below the checked path of a root'
+        top = os.path.normpath(root.host_path(self.args.path))
+        if not self._mounts:
+            return [top]
+        # the mount containing the top itself
+        top_mount = max((x for x in self._mounts if top == x or top.startswith(x.rstrip('/') + '/')), key=len, default='/')
+        if not self.walked(self._mounts.get(top_mount)):
+            self.logger.warning(f'Skipping {self._mounts.get(top_mount)} mount: {top_mount}')
+            return list()
+
+        tops = [top]
+        skipped = list()
+        for mount_point in sorted(self._mounts):
+            if not mount_point.startswith(top.rstrip('/') + '/'):
+                continue
+            # nested in a skipped mount or in an excluded subtree
+            if any(mount_point.startswith(x + '/') for x in skipped):
+                continue
+            parts = root.root_path(mount_point).split('/')
+            if any(self.ignored(root, '/'.join(parts[:idx])) for idx in range(2, len(parts) + 1)):
+                skipped.append(mount_point)
+                continue
+            if not self.walked(self._mounts[mount_point]):
+                self.logger.debug(f'Skipping {self._mounts[mount_point]} mount: {mount_point}')
+                skipped.append(mount_point)
+                continue
+            tops.append(mount_point)
+        return tops
+
+    def index_portage_dirs(self, portage_objects):
+        'collect all directories containing portage objects at any depth'
+        dirs = set()
+        for path in portage_objects:
+            # dir objects count themselves, their contents are not cruft by default
+            path = path.rstrip('/') if path.endswith('/') else os.path.dirname(path)
+            while path + '/' not in dirs:
+                dirs.add(path.rstrip('/') + '/')
+                if path == '/':
+                    break
+                path = os.path.dirname(path)
+        return dirs
+
+    def aggregate_subtree(self, root, host_top, errors, progress, top):
+        'sum up file count, size and newest mtime in one scan, returns the top and every dir the walk will visit below dirs containing ignored paths (None for those)'
+        # scanned dirs count as walked dirs of the calling worker
+        totals = dict()
+        parents = dict()
+        # ignored objects need the regular walk around them to keep the report accurate
+        tainted = set()
+        # a single dir exclusion of the top itself keeps its contents in the report
+        if self.ignored(root, root.root_path(host_top) + '/'):
+            tainted.add(host_top)
+        try:
+            totals[host_top] = [os.lstat(host_top).st_mtime, 0, 0]
+        except OSError:
+            # let the regular walk report it
+            return {host_top: None}
+        stack = [host_top]
+        while stack:
+            time.sleep(self.throttle(self._dir_bucket))
+            host_dirpath = stack.pop()
+            total = totals[host_dirpath]
+            progress[top] += 1
+            # unreadable dirs and vanished entries are reported and left out, the rest is still aggregated
+            try:
+                with os.scandir(host_dirpath) as it:
+                    for entry in it:
+                        path = root.root_path(entry.path)
+                        if self.ignored(root, path):
+                            tainted.add(host_dirpath)
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError as e:
+                            errors.append(str(e))
+                            continue
+                        total[0] = max(total[0], st.st_mtime)
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.ignored(root, path + '/'):
+                                tainted.add(entry.path)
+                            if entry.path not in self._mounts:
+                                totals[entry.path] = [st.st_mtime, 0, 0]
+                                parents[entry.path] = host_dirpath
+                                stack.append(entry.path)
+                        else:
+                            total[1] += 1
+                            total[2] += st.st_size
+            except OSError as e:
+                errors.append(str(e))
+
+        for host_path in list(tainted):
+            while host_path in parents and parents[host_path] not in tainted:
+                host_path = parents[host_path]
+                tainted.add(host_path)
+        # children are discovered after their parents
+        for host_path in reversed(list(totals)):
+            if host_path in parents:
+                newest, n_files, size = totals[host_path]
+                total = totals[parents[host_path]]
+                total[0] = max(total[0], newest)
+                total[1] += n_files
+                total[2] += size
+        return {k: None if k in tainted else tuple(v)
+                for k, v in totals.items() if k == host_top or parents[k] in tainted}
+
+    def walk_system_tree(self, root, top, progress):
+        'walk the system tree of a root within one mount, returns objects, aggregated dirs and error messages to keep logging in the event loop'
         objects = set()
-        for root, dirs, files in os.walk(self.args.path, followlinks=False, onerror=lambda x: self.logger.error(str(x))):
+        aggregated = dict()
+        errors = list()
+        # depth of dirs below the topmost directory without portage objects
+        unowned_depth = dict()
+        # aggregates of dirs below dirs containing ignored paths, from the scan of their subtree
+        subtree_aggregates = dict()
+        # only this worker writes its entry, the event loop just reads it
+        progress[top] = 0
+        for dirpath, dirs, files in os.walk(top, followlinks=False, onerror=lambda x: errors.append(str(x))):
+            progress[top] += 1
+            time.sleep(self.throttle(self._dir_bucket))
+            host_dirpath = dirpath
+            dirpath = root.root_path(dirpath)
             
             for d in list(dirs):
-                path = os.path.join(root, d)
+                path = os.path.join(dirpath, d)
+                host_path = os.path.join(host_dirpath, d)
+                try:
+                    st = os.lstat(host_path)
+                except OSError as e:
+                    errors.append(str(e))
+                    dirs.remove(d)
+                    continue
                 
                 # handle ignored directory symlinks as files
-                if os.path.islink(path):
+                if stat.S_ISLNK(st.st_mode):
                     dirs.remove(d)
                     files.append(d)
                     continue
                 
                 # remove excluded subtrees early to speed up walk (eg, user data)
                 # leave dir without slash in objects => filtered by this regex anyway
-                if self.ignored(path):
+                if self.ignored(root, path):
                     dirs.remove(d)
                     objects.add(path)
                     continue
+
+                # do not cross mount points, they are walked by their own worker or skipped.
+                # decided by the mount table alone: a changed device does not mean a mount point
+                # (eg, nested btrfs subvolumes) and bind mounts keep the device of their source.
+                if host_path in self._mounts:
+                    dirs.remove(d)
+                    objects.add(path + '/')
+                    continue
+
+                # do not descend into subtrees without portage objects, everything in there is cruft
+                if self.args.aggregate and path + '/' not in root.data['portage_dirs']:
+                    depth = unowned_depth.get(host_dirpath, -1) + 1
+                    if depth >= self.args.aggregate_depth:
+                        # one scan per subtree, dirs below ignored paths are looked up when walked
+                        if host_path not in subtree_aggregates:
+                            subtree_aggregates.update(self.aggregate_subtree(root, host_path, errors, progress, top))
+                        aggregate = subtree_aggregates.pop(host_path)
+                        if aggregate is not None:
+                            dirs.remove(d)
+                            objects.add(path + '/')
+                            aggregated[path + '/'] = aggregate
+                            continue
+                    unowned_depth[host_path] = depth
                 
                 # add a trailing slash to allow easy distinction between subtree and single dir exclusion
                 objects.add(path + '/')
                 
             for f in files:
-                path = os.path.join(root, f)
+                path = os.path.join(dirpath, f)
                 objects.add(path)
                 
                 # report broken symlinks but keep them in list (needed for portage - system report)
-                if not os.path.exists(path):
-                    self.logger.error('Broken symlink detected: ' + path)
+                if not os.path.exists(os.path.join(host_dirpath, f)):
+                    errors.append('Broken symlink detected: ' + path)
                     
+        return objects, aggregated, errors
+
+    async def collect_system_objects(self, root):
+        """Collect all objects in the system tree."""
+        if 'patterns' not in root.data:
+            root.data['patterns'] = await self.collect_ignore_patterns(root)
+            
+        if self.args.aggregate and 'portage_dirs' not in root.data:
+            if 'portage' not in root.data:
+                root.data['portage'] = await self.collect_portage_objects(root)
+            root.data['portage_dirs'] = self.index_portage_dirs(root.data['portage'])
+            
+        self.logger.info('Collecting objects in system tree...')
+        if self._mounts is None:
+            self._mounts = self.read_mountinfo()
+        stats = dict()
+        if os.access(root.stats_path, os.R_OK):
+            with open(root.stats_path, 'rb') as stats_file:
+                stats = pickle.load(stats_file)
+        progress = dict()
+        t1 = time.monotonic()
+        if self.args.low_impact:
+            progress_task = asyncio.create_task(self.report_progress(progress, stats.get(self.walk_mode())),
+                                                name=pylon.base_cli.current_task_name())
+        
+        # walk every mount in a worker thread, so several mounts and roots are scanned in parallel
+        objects = set()
+        root.aggregated = dict()
+        try:
+            for mount_objects, aggregated, errors in await asyncio.gather(*(asyncio.to_thread(self.walk_system_tree, root, top, progress)
+                                                                            for top in self.walk_tops(root))):
+                objects |= mount_objects
+                root.aggregated.update(aggregated)
+                for error in errors:
+                    self.logger.error(error)
+        finally:
+            if self.args.low_impact:
+                progress_task.cancel()
+
+        # previous walk statistics for the ETA of the next run
+        stats[self.walk_mode()] = (sum(progress.values()), time.monotonic() - t1)
+        with open(root.stats_path, 'wb') as stats_file:
+            pickle.dump(stats, stats_file)
         return objects
 
-    async def collect_cruft_objects(self):
-        if 'patterns' not in self.data:
-            self.data['patterns'] = await self.collect_ignore_patterns()
-        if 'portage' not in self.data:
-            self.data['portage'] = await self.collect_portage_objects()
-        if 'system' not in self.data:
-            self.data['system'] = await self.collect_system_objects()
+    async def report_progress(self, progress, previous):
+        'periodically log walked directories, with an ETA when the previous walk in the same mode is known'
+        t1 = time.monotonic()
+        while True:
+            await asyncio.sleep(progress_interval)
+            n_dirs = sum(progress.values())
+            rate = n_dirs / (time.monotonic() - t1)
+            if previous is None or not rate:
+                self.logger.info(f'Walked {n_dirs} dirs ({rate:.0f}/s)...')
+                continue
+            n_total = max(previous[0], n_dirs)
+            eta = datetime.timedelta(seconds=int((n_total - n_dirs) / rate))
+            self.logger.info(f'Walked {n_dirs}/{n_total} dirs ({100 * n_dirs // n_total}%, {rate:.0f}/s), ETA {eta}...')
+
+    async def collect_cruft_objects(self, root):
+        if 'patterns' not in root.data:
+            root.data['patterns'] = await self.collect_ignore_patterns(root)
+        if 'portage' not in root.data:
+            root.data['portage'] = await self.collect_portage_objects(root)
+        if 'system' not in root.data:
+            root.data['system'] = await self.collect_system_objects(root)
             
         self.logger.info('Identifying cruft...')
         self.logger.debug('Generating difference set (system - portage)...')
-        cruft = self.data['system'] - self.data['portage']
+        cruft = root.data['system'] - root.data['portage'].keys()
         
         self.logger.debug('Applying ignore patterns on (system - portage)...')
-        remaining = {path for path in cruft if not self.ignored(path)}
+        remaining = {path for path in cruft if not self.ignored(root, path)}
         
         self.logger.debug('Removing parent directories of already ignored paths...')
         ignored = cruft - remaining
         for path in ignored:
             remaining = {x for x in remaining if not path.startswith(x) or x[-1] != '/'}
             
-        # FIXME use self._n_ignored ?
-        self.n_ignored = len(cruft) - len(remaining)
+        # FIXME use root._n_ignored ?
+        root.n_ignored = len(cruft) - len(remaining)
         
         # add a date info to the remaining objects
         cruft_dict = dict()
         remaining = sorted(remaining)
         for path in remaining:
+            # aggregated dirs already carry their newest mtime, file count and size
+            if path in root.aggregated:
+                cruft_dict[path] = list(root.aggregated[path])
+                continue
             try:
-                cruft_dict[path] = [time.localtime(os.lstat(path).st_mtime)]
+                cruft_dict[path] = [os.lstat(root.host_path(path)).st_mtime]
             except OSError:
                 self.logger.error('Path disappeared: ' + path)
                 
         return cruft_dict
 
-    async def collect_cached_data(self):
+    async def collect_cached_data(self, root):
         self.logger.debug('Collecting data and using cache when possible...')
         
-        cache_path = os.path.join(cache_base_path, cache_base_name + '_' + self.hostname)
         dirty = False
-        if os.access(cache_path, os.R_OK):
-            with open(cache_path, 'rb') as cache_file:
-                self.logger.info(f'Loading cache {cache_path}...')
-                self.data = pickle.load(cache_file)
+        if os.access(root.cache_path, os.R_OK):
+            with open(root.cache_path, 'rb') as cache_file:
+                self.logger.info(f'Loading cache {root.cache_path}...')
+                root.data = pickle.load(cache_file)
+        if root.data.get('cache_format') != cache_format:
+            if root.data:
+                self.logger.warning('Outdated cache format => discarding cache...')
+            root.data = {'cache_format': cache_format}
                 
+        # only what changes with the content, the atime changes with every read
+        stat_state = lambda x: hashlib.md5(str((x.st_ino, x.st_size, x.st_mtime_ns)).encode('utf-8')).hexdigest()
+
         # determine portage dir state
-        portage_state = hashlib.md5(str(os.stat(vardb_path)).encode('utf-8')).hexdigest()
+        portage_state = stat_state(os.stat(root.vardb_path))
 
         # determine pattern dir state
         patterns_state = ''
-        for root, dirs, files in os.walk(self.args.pattern_root):
+        for dirpath, dirs, files in os.walk(self.args.pattern_root):
             for f in files:
-                patterns_state += hashlib.md5(str(os.stat(os.path.join(root, f))).encode('utf-8')).hexdigest()
+                patterns_state += stat_state(os.stat(os.path.join(dirpath, f)))
         patterns_state = hashlib.md5(patterns_state.encode('utf-8')).hexdigest()
         
-        if ('portage' not in self.data or
-            'portage_state' not in self.data or
-            self.data['portage_state'] != portage_state or
+        if ('portage' not in root.data or
+            'portage_state' not in root.data or
+            root.data['portage_state'] != portage_state or
             self.args.check):
             
             # portage changes can affect patterns (deriving patterns from portage API calls),
             # thus collect portage first, which implicitely collects patterns.
-            self.data.pop('patterns', None)
-            self.data.pop('patterns_state', None)
-            self.data['portage'] = await self.collect_portage_objects()
-            self.data['portage_state'] = portage_state
+            root.data.pop('patterns', None)
+            root.data.pop('patterns_state', None)
+            root.data['portage'] = await self.collect_portage_objects(root)
+            root.data['portage_dirs'] = self.index_portage_dirs(root.data['portage'])
+            root.data['portage_state'] = portage_state
             dirty = True
         else:
             self.logger.warning('No portage changes detected => reusing cache...')
             
-        if ('patterns' not in self.data or
-            'patterns_state' not in self.data or
-            self.data['patterns_state'] != patterns_state):
+        if ('patterns' not in root.data or
+            'patterns_state' not in root.data or
+            root.data['patterns_state'] != patterns_state):
 
             # FIXME this is called twice (first portage or system calls patterns implicitly, second no patterns_state when uncached => called again)
-            self.data['patterns'] = await self.collect_ignore_patterns()
-            self.data['patterns_state'] = patterns_state
+            root.data['patterns'] = await self.collect_ignore_patterns(root)
+            root.data['patterns_state'] = patterns_state
             dirty = True
         else:
             self.logger.warning('No pattern file changes detected => reusing cache...')
             
         if dirty:
-            with open(cache_path, 'wb') as cache_file:
+            with open(root.cache_path, 'wb') as cache_file:
                 self.logger.info('Storing cache...')
-                pickle.dump(self.data, cache_file)
+                pickle.dump(root.data, cache_file)
 
-    @pylon.gentoo_cli.subcommand
-    async def report(self):
-        # ====================================================================
-        'identify potential cruft objects on your system'
-        # FIXME
-        self.data = {}  # Initialize data dictionary
-        
-        await self.collect_cached_data()
-        # FIXME use self._cruft_dict ?
-        self.cruft_dict = await self.collect_cruft_objects()
+    async def setup(self):
+        await super().setup()
+        self._text_patterns = dict()
+        # read when walking, owner and pattern listing work without /proc
+        self._mounts = None
+
+        # throttling state
+        self._dir_bucket = self._hash_bucket = None
+        self._load_stamp = 0
+        self._overloaded = False
+        if self.args.low_impact:
+            # both priorities are inherited by pattern scripts
+            os.nice(19 - os.nice(0))
+            try:
+                await self.dispatch(f'ionice -c 3 -p {os.getpid()}', output=None, passive=True)
+            except pylon.script_error:
+                self.logger.warning('Could not set idle I/O priority')
+            self._dir_bucket = pylon.token_bucket(self.args.max_dirs)
+            self._hash_bucket = pylon.token_bucket(self.args.max_hash_rate)
+        paths = self.args.roots or ['/']
+        if len(paths) == 1:
+            self._roots = [scan_root(paths[0], self.hostname)]
+        else:
+            # a broken root (eg, no portage db) must not keep the others from being scanned
+            self._roots = list()
+            for path in paths:
+                try:
+                    self._roots.append(scan_root(path, self.hostname))
+                except Exception as e:
+                    self.logger.error(f'{path}: skipping root, {e}')
+            if not self._roots:
+                raise pylon.script_error('no root left to scan')
+
+    async def for_each_root(self, func):
+        'run a coroutine function for every root, in parallel tasks named after the root when there are several'
+        if len(self.roots) == 1:
+            await func(self.roots[0])
+            return
+
+        async def run_root(root):
+            # log in the root task to get its prefix, the other roots keep running
+            try:
+                await func(root)
+            except Exception as e:
+                self.logger.error(f'skipping root, {e}')
+                root.failed = True
+        await self.dispatch_group({'task': run_root(root), 'name': root.path} for root in self.roots if not root.failed)
+
+    def walk_mode(self):
+        'walks of different checked paths, aggregate modes or walked filesystems are not comparable, keep their snapshots and stats apart'
+        mode = ''
+        if self.args.path.rstrip('/'):
+            mode += '_path' + self.args.path.rstrip('/').replace('/', '_')
+        if self.args.aggregate:
+            mode += f'_aggregate{self.args.aggregate_depth}'
+        if self.args.fs_types:
+            mode += '_fs_' + '_'.join(sorted(self.args.fs_types))
+        return mode
+
+    def snapshot_base(self, root):
+        return root.snapshot_prefix + self.walk_mode()
+
+    def snapshots(self, root):
+        'snapshot paths, oldest first'
+        return sorted(glob.glob(self.snapshot_base(root) + '.[0-9]*'))
+
+    def load_snapshot(self, root):
+        'return the (path, mtime) pairs of the latest cruft snapshot, sorted by path'
+        snapshots = self.snapshots(root)
+        if not snapshots:
+            self.logger.warning('No previous snapshot => reporting all cruft objects as new...')
+            return list()
+        with open(snapshots[-1], 'rb') as snapshot_file:
+            self.logger.info(f'Loading snapshot {snapshots[-1]}...')
+            return pickle.load(snapshot_file)
+
+    def store_snapshot(self, root):
+        # cruft_dict is already sorted by path
+        # sortable by time, the pid keeps parallel runs apart
+        snapshot_path = self.snapshot_base(root) + '.' + datetime.datetime.now().strftime('%Y%m%d%H%M%S%f') + f'.{os.getpid()}'
+        with open(snapshot_path, 'wb') as snapshot_file:
+            self.logger.info(f'Storing snapshot {snapshot_path}...')
+            pickle.dump([(k, v[0]) for k, v in root.cruft_dict.items()], snapshot_file)
+
+        # retention
+        for snapshot_path in self.snapshots(root)[:-max(self.args.keep_snapshots, 1)]:
+            self.logger.debug('Removing old snapshot: ' + snapshot_path)
+            os.remove(snapshot_path)
+
+    def report_diff(self, root):
+        'report cruft changes since the last snapshot, using a sorted merge'
+        prefix = root.path + ': ' if len(self.roots) > 1 else ''
+        date_str = lambda x: time.asctime(time.localtime(x))
+        lines = list()
+        n_added = n_removed = n_changed = 0
+        for path, old, new in pylon.sorted_diff(self.load_snapshot(root),
+                                                ((k, v[0]) for k, v in root.cruft_dict.items())):
+            if old is None:
+                n_added += 1
+                lines.append(f'{prefix}+ {path}, {date_str(new)}')
+            elif new is None:
+                n_removed += 1
+                lines.append(f'{prefix}- {path}, {date_str(old)}')
+            else:
+                n_changed += 1
+                lines.append(f'{prefix}~ {path}, {date_str(old)} -> {date_str(new)}')
+        if lines:
+            self.logger.info('Cruft changes:' + os.linesep + os.linesep.join(lines))
+        self.logger.warning(f'Cruft objects added: {n_added}, removed: {n_removed}, changed: {n_changed}')
+        self.store_snapshot(root)
+
+    async def report_root(self, root):
+        await self.collect_cached_data(root)
+        # FIXME use root._cruft_dict ?
+        root.cruft_dict = await self.collect_cruft_objects(root)
         
-        if self.cruft_dict:
-            cruft_keys = list(self.cruft_dict.keys())
+        if self.args.diff:
+            self.report_diff(root)
+        elif root.cruft_dict:
+            cruft_keys = list(root.cruft_dict.keys())
             
             # useful sort keys
             path = lambda x: x
-            date = lambda x: self.cruft_dict[x][0]
+            date = lambda x: root.cruft_dict[x][0]
             path_str = lambda x: path(x)
-            date_str = lambda x: time.asctime(date(x))
+            date_str = lambda x: time.asctime(time.localtime(date(x)))
+            # aggregated dirs also carry file count and size
+            size_str = lambda x: ', {} files, {} bytes'.format(*root.cruft_dict[x][1:]) if len(root.cruft_dict[x]) > 1 else ''
             
             # sort & format according to option
-            fmt = '{path_str}, {date_str}'
+            fmt = '{path_str}, {date_str}{size_str}'
+            # prefix every line with its root in a combined report
+            if len(self.roots) > 1:
+                fmt = root.path + ': ' + fmt
             reverse = False
             sort_key = path
             if self.args.format == 'date':
@@ -342,15 +888,94 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
                 sort_key = date
             if self.args.format == 'rm_chain':
                 fmt = 'rm -rf "{path_str}" && \\'
+                path_str = lambda x: root.host_path(path(x))
             cruft_keys.sort(key=sort_key, reverse=reverse)
             
             self.logger.info('Cruft objects:' + os.linesep +
                              os.linesep.join(fmt.format(path_str=path_str(co),
-                                                        date_str=date_str(co))
+                                                        date_str=date_str(co),
+                                                        size_str=size_str(co))
                                              for co in cruft_keys))
             self.logger.warning(f'Cruft objects identified: {len(cruft_keys)}')
             
-        self.logger.info(f'Cruft files ignored: {self.n_ignored}')
+        self.logger.info(f'Cruft files ignored: {root.n_ignored}')
+
+    @pylon.gentoo_cli.subcommand
+    async def report(self):
+        # ====================================================================
+        'identify potential cruft objects on your system'
+        await self.for_each_root(self.report_root)
+
+    def contains_ignored(self, root, host_dir):
+        'check if walking a dir finds ignored objects not owned by portage, stops at the first one'
+        if self._mounts is None:
+            self._mounts = self.read_mountinfo()
+        stack = [host_dir]
+        while stack:
+            with contextlib.suppress(OSError), os.scandir(stack.pop()) as it:
+                for entry in it:
+                    path = root.root_path(entry.path)
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    for candidate in (path, path + '/') if is_dir else (path,):
+                        if candidate not in root.data['portage'] and self.ignored(root, candidate):
+                            return True
+                    if is_dir and (entry.path not in self._mounts or self.walked(self._mounts[entry.path])):
+                        stack.append(entry.path)
+        return False
+
+    def owner_of(self, root, path, patterns):
+        'determine the owning package of a path, or whether it is ignored or cruft'
+        # normalize like the portage and system tree objects
+        path = os.path.abspath(path)
+        path = os.path.join(root.realpath(os.path.dirname(path)), os.path.basename(path))
+
+        # indexed objects are owned even when they went missing
+        pkgs = root.data['portage'].get(path) or root.data['portage'].get(path.rstrip('/') + '/')
+        if pkgs:
+            return ', '.join(pkgs)
+
+        host_path = root.host_path(path)
+        if not os.path.lexists(host_path):
+            return 'missing'
+        if os.path.isdir(host_path) and not os.path.islink(host_path):
+            path = path.rstrip('/') + '/'
+
+        # parent dirs and the path itself without trailing slash are excluded subtrees, top-down like the system tree walk
+        parts = path.rstrip('/').split('/')
+        candidates = ['/'.join(parts[:idx]) for idx in range(2, len(parts) + 1)]
+        if path.endswith('/'):
+            candidates.append(path)
+        for candidate in candidates:
+            if self.ignored(root, candidate):
+                for regex, files in patterns:
+                    if regex.match(candidate):
+                        return f'ignored by {regex.pattern} ({", ".join(sorted(files))})'
+        # like report, which drops the parent dirs of ignored objects
+        if path.endswith('/') and self.contains_ignored(root, host_path):
+            return 'contains ignored paths'
+        return 'cruft'
+
+    @pylon.gentoo_cli.subcommand
+    async def owner(self):
+        # ====================================================================
+        'report the owning package of paths, or the ignore pattern covering them'
+        self.args.check = False
+        self.args.fs_types = None
+        await self.for_each_root(self.collect_cached_data)
+
+        # identifying the matching pattern needs every pattern on its own
+        patterns = {root.path: [(re.compile(k), v) for k, v in root.data['patterns']['map'].items()]
+                    for root in self.roots if not root.failed}
+
+        paths = self.args.paths or (line.rstrip(os.linesep) for line in sys.stdin)
+        for path in paths:
+            if not path:
+                continue
+            for root in self.roots:
+                if root.failed:
+                    continue
+                prefix = root.path + ': ' if len(self.roots) > 1 else ''
+                print(f'{prefix}{path}: {self.owner_of(root, path, patterns[root.path])}')
 
     @pylon.gentoo_cli.subcommand
     async def list(self):
@@ -361,33 +986,35 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
         # FIXME check idea: determine nr of files in excluded subtrees => list largest ones
         # FIXME check idea: list pattern files for packages which are not installed => delete, or keep for larger user base?
 
-        # FIXME
-        self.data = {}  # Initialize data dictionary
-        
         # re-using functions from report op requires sane args defaults
         self.args.check = False  # Ensure sane defaults
         self.args.path = '/'
+        self.args.fs_types = None
+        self.args.aggregate = False
         
-        await self.collect_cached_data()
-        if 'system' not in self.data:
-            self.data['system'] = await self.collect_system_objects()
+        await self.for_each_root(self.list_root)
+
+    async def list_root(self, root):
+        await self.collect_cached_data(root)
+        if 'system' not in root.data:
+            root.data['system'] = await self.collect_system_objects(root)
             
         # FIXME put this verbose info into a separate operation
         self.logger.info('List of patterns and the files which generated them:')
         import pprint
-        pprint.pprint(self.data['patterns']['map'])
+        pprint.pprint(root.data['patterns']['map'])
         
         # do some sanity checking
         self.logger.info('Identical patterns are listed in multiple files:')
-        pprint.pprint({k: v for k, v in self.data['patterns']['map'].items() if len(v) != 1})
+        pprint.pprint({k: v for k, v in root.data['patterns']['map'].items() if len(v) != 1})
         
         # FIXME multiprocessing? takes too long, output too verbose
         # FIXME try to match with single_regex first, if match => iterate through every pattern
         #self.ui.info('Redundant ignore patterns (remove from pattern file, or leave it to mask MD5 fails):')
-        #for k,v in sorted(self.data['patterns']['map'].items()):
+        #for k,v in sorted(root.data['patterns']['map'].items()):
         #    matched = False
         #    pattern = re.compile(k)
-        #    for path in self.data['portage']:
+        #    for path in root.data['portage']:
         #        if pattern.match(path):
         #            matched = True
         #            break
@@ -396,10 +1023,10 @@ class cruft(pylon.gentoo_cli.gentoo_cli):
         #        
         ## FIXME multiprocessing? takes too long, output too verbose
         #self.ui.info('Non-matching patterns (be patient!):')
-        #for k,v in sorted(self.data['patterns']['map'].items()):
+        #for k,v in sorted(root.data['patterns']['map'].items()):
         #    matched = False
         #    pattern = re.compile(k)
-        #    for path in self.data['system']:
+        #    for path in root.data['system']:
         #        if pattern.match(path):
         #            matched = True
         #            break
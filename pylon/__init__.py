@@ -11,6 +11,8 @@ Etymology: Greek pylOn, from pylE gate
 import itertools
 import math
 import os
+import threading
+import time
 # import submodules to simplify pylon import statement in user script
 import pylon.base_cli
 import pylon.gentoo_cli
@@ -32,6 +34,32 @@ class path_lock():
     def __exit__(self, exc_type, exc_val, exc_tb):
         os.rmdir(self._path)
 
+# =====================================================================================================================
+# classes
+# =====================================================================================================================
+class token_bucket():
+    'thread-safe rate limiter, tokens refill at a given rate per second up to a burst size'
+    def __init__(self, _rate, _burst=None):
+        self.__dict__.update(locals())
+        self._burst = _burst or _rate
+        self._tokens = self._burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self, n=1):
+        'take n tokens, return the seconds to wait until they are paid off'
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+            self._stamp = now
+            # allow debt, large requests simply make later callers wait longer
+            self._tokens -= n
+            return max(0, -self._tokens / self._rate)
+
+    def acquire(self, n=1):
+        'blocking variant of delay'
+        time.sleep(self.delay(n))
+
 # =====================================================================================================================
 # exceptions
 # =====================================================================================================================
@@ -72,6 +100,25 @@ def flatten(iterable):
         else:
             yield elem
 
+def sorted_diff(old, new):
+    'merge two iterables of (key, value) pairs sorted by key, yield (key, old value, new value) where they differ'
+    old = iter(old)
+    new = iter(new)
+    old_item = next(old, None)
+    new_item = next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield old_item[0], old_item[1], None
+            old_item = next(old, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield new_item[0], None, new_item[1]
+            new_item = next(new, None)
+        else:
+            if old_item[1] != new_item[1]:
+                yield old_item[0], old_item[1], new_item[1]
+            old_item = next(old, None)
+            new_item = next(new, None)
+
 def unique_logspace(data_points, interval_range):
     'provide logarithmically spaced integers in a certain range'
     data_points = min(data_points, interval_range)
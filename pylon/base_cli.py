@@ -8,18 +8,52 @@ a command-line task dispatcher
   stream , None    => cfg=PIPE/NULL, stderr/stdout=stream/None
   sys.std, None    => cfg=PIPE/NULL, stderr/stdout=sys.std/None
   None   , None    => cfg=None     , stderr/stdout=None
+- log records and replaced stdout/stderr writes share one queue, a listener thread
+  writes them in batches. write errors (eg, EPIPE when piped into head) are reported
+  once on stderr and further output to that stream is dropped.
+- output prefixes use the task name kept in a contextvar (set for the main task,
+  by dispatch and dispatch_group, inherited by tasks and worker threads). tasks
+  created with a plain create_task inherit the name of their creator, pass
+  context=named_context(name) to prefix them. only tasks running outside run()
+  fall back to their asyncio task name.
 '''
 
 import argparse
 import asyncio
 import contextlib
+import contextvars
 import datetime
 import functools
 import io
+import itertools
 import logging
+import logging.handlers
 import os
 import pylon
+import queue
 import sys
+import threading
+import traceback
+
+# name of the current task (or worker thread started from it), used to prefix interleaved output
+task_name = contextvars.ContextVar('task_name', default=None)
+
+def current_task_name():
+    'task name for output prefixes, falls back to the asyncio task name outside named contexts'
+    name = task_name.get()
+    if name is None:
+        # no running loop in worker threads
+        with contextlib.suppress(RuntimeError):
+            task = asyncio.current_task()
+            if task is not None:
+                name = task.get_name()
+    return name or 'MainTask'
+
+def named_context(name):
+    'copy the current context with another task name, for create_task'
+    context = contextvars.copy_context()
+    context.run(task_name.set, name)
+    return context
 
 # =====================================================================================================================
 # decorators
@@ -39,20 +73,93 @@ def log_exec_time(func):
 # classes
 # =====================================================================================================================
 class prefixed_stringio(io.StringIO):
-    def __init__(self, _stream, _newline=True):
+    def __init__(self, _stream, _queue, _newline=True):
         super().__init__()
         self.__dict__.update(locals())
     
     def write(self, s):
-        for idx,line in enumerate(s.splitlines(keepends=True)):
-            task_name = asyncio.current_task().get_name()
-            if (idx == 0 and
-                not self._newline or
-                task_name == 'MainTask'):
-                self._stream.write(line)
-            else:
-                self._stream.write(f'{task_name}: {line}')
+        name = current_task_name()
+        text = s
+        if name != 'MainTask':
+            text = ''.join(line if idx == 0 and not self._newline else f'{name}: {line}'
+                           for idx,line in enumerate(s.splitlines(keepends=True)))
         self._newline = s.endswith(os.linesep)
+        # written by the output listener, in order with log records
+        self._queue.put_nowait((self._stream, text))
+
+class batch_writer():
+    'collect text for several streams in order, consecutive text for the same stream is written at once'
+    def __init__(self):
+        self._pending = list()
+        self._failed = set()
+
+    def write(self, stream, text):
+        self._pending.append((stream, text))
+
+    def flush(self):
+        pending, self._pending = self._pending, list()
+        for stream, group in itertools.groupby(pending, key=lambda x: x[0]):
+            if stream in self._failed:
+                continue
+            try:
+                stream.write(''.join(text for _, text in group))
+                stream.flush()
+            except (OSError, ValueError) as e:
+                # drop further output to this stream, but keep writing the others (eg, stdout piped into head)
+                self._failed.add(stream)
+                if isinstance(e, BrokenPipeError):
+                    # python's recommendation to avoid another error when the stream is flushed at exit
+                    with contextlib.suppress(OSError, ValueError):
+                        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+                if stream is not sys.__stderr__:
+                    with contextlib.suppress(OSError, ValueError):
+                        sys.__stderr__.write(f'Output to {getattr(stream, "name", stream)} failed, dropping it: {e}{os.linesep}')
+                        sys.__stderr__.flush()
+
+class batch_stream_handler(logging.StreamHandler):
+    'stream handler leaving the actual writing to a batch_writer'
+    def __init__(self, _writer, stream=None):
+        super().__init__(stream)
+        self._writer = _writer
+
+    def emit(self, record):
+        try:
+            self._writer.write(self.stream, self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+class queue_handler(logging.handlers.QueueHandler):
+    'queue records as they are, the listener runs in the same process'
+    def prepare(self, record):
+        # merge args now, they might change until the listener formats the record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class output_listener(logging.handlers.QueueListener):
+    'handle queued log records and (stream, text) output, write everything once the queue is drained'
+    def __init__(self, _queue, *handlers, _writer):
+        super().__init__(_queue, *handlers, respect_handler_level=True)
+        self._writer = _writer
+
+    def handle(self, record):
+        # an exception would end the listener thread, leaving flush_output waiting and all later output unwritten
+        try:
+            if isinstance(record, tuple):
+                self._writer.write(*record)
+            elif isinstance(record, threading.Event):
+                # flush request
+                try:
+                    self._writer.flush()
+                finally:
+                    record.set()
+            else:
+                super().handle(record)
+            if self.queue.empty():
+                self._writer.flush()
+        except Exception:
+            with contextlib.suppress(OSError, ValueError):
+                traceback.print_exc(file=sys.__stderr__)
 
 class base_cli():
     __doc__ = sys.modules[__name__].__doc__
@@ -78,24 +185,26 @@ class base_cli():
         self._formatter = logging.Formatter('%(task_str)s### %(name)s(%(asctime)s) %(levelname)s: %(message)s')
         class task_name_adapter(logging.LoggerAdapter):
             def process(self, msg, kwargs):
-                task_name = asyncio.current_task().get_name()
-                task_str = ''
-                if task_name != 'MainTask':
-                    task_str = f'{task_name}: '
-                kwargs.setdefault('extra', {})['task_str'] = task_str
+                name = current_task_name()
+                kwargs.setdefault('extra', {})['task_str'] = '' if name == 'MainTask' else f'{name}: '
                 return msg, kwargs
         self._logger_adapter = task_name_adapter(self._logger)
 
+        # log records and stdout/stderr output are queued, a listener thread writes them in batches
+        self._queue = queue.SimpleQueue()
+        self._writer = batch_writer()
+        self._logger.addHandler(queue_handler(self._queue))
+        
         # stdout/stderr logging
-        handler = logging.StreamHandler(sys.__stdout__)
-        handler.setFormatter(self._formatter)
-        handler.setLevel(logging.DEBUG)
-        handler.addFilter(lambda x: x.levelno < logging.WARNING)
-        self._logger.addHandler(handler)
-        handler = logging.StreamHandler(sys.__stderr__)
-        handler.setFormatter(self._formatter)
-        handler.setLevel(logging.WARNING)
-        self._logger.addHandler(handler)
+        stdout_handler = batch_stream_handler(self._writer, sys.__stdout__)
+        stdout_handler.setFormatter(self._formatter)
+        stdout_handler.setLevel(logging.DEBUG)
+        stdout_handler.addFilter(lambda x: x.levelno < logging.WARNING)
+        stderr_handler = batch_stream_handler(self._writer, sys.__stderr__)
+        stderr_handler.setFormatter(self._formatter)
+        stderr_handler.setLevel(logging.WARNING)
+        self._listener = output_listener(self._queue, stdout_handler, stderr_handler, _writer=self._writer)
+        self._listener.start()
         
         self._parser = argparse.ArgumentParser(description=self.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
         # define the common basic set of arguments
@@ -123,8 +232,21 @@ class base_cli():
 
         # - add prefix by default for interleaved output of parallel coroutines
         # - in setup() to avoid prefixing when printing parser help string
-        sys.stdout = prefixed_stringio(sys.__stdout__)
-        sys.stderr = prefixed_stringio(sys.__stderr__)
+        sys.stdout = prefixed_stringio(sys.__stdout__, self._queue)
+        sys.stderr = prefixed_stringio(sys.__stderr__, self._queue)
+
+    def add_log_handler(self, handler):
+        'attach another handler to the output listener, use batch_stream_handler(self._writer, ...) to keep batching'
+        self._listener.handlers += (handler,)
+
+    def flush_output(self):
+        'block until all queued log records and output are written'
+        flushed = threading.Event()
+        self._queue.put_nowait(flushed)
+        # do not wait forever for a stopped listener
+        while not flushed.wait(1):
+            if self._listener._thread is None or not self._listener._thread.is_alive():
+                break
 
     async def cleanup(self):
         pass
@@ -132,6 +254,7 @@ class base_cli():
     async def dispatch(self, cmd, **kwargs):
         self.logger.debug(cmd)
 
+        env = kwargs.get('env', None)
         name = kwargs.get('name', None)
         output = kwargs.get('output', (sys.stderr, sys.stdout))
         passive = kwargs.get('passive', False)
@@ -151,10 +274,11 @@ class base_cli():
 
         if not self.args.dry_run or passive:
             if name is None:
-                name = asyncio.current_task().get_name()
+                name = current_task_name()
              
             proc = await asyncio.create_subprocess_shell(
                 cmd,
+                env=env,
                 stderr=stderr_cfg,
                 stdout=stdout_cfg)
              
@@ -175,9 +299,9 @@ class base_cli():
                         async with asyncio.timeout(0.1):
                             async with asyncio.TaskGroup() as tg:
                                 if stderr_cfg is asyncio.subprocess.PIPE:
-                                    tg.create_task(reader(proc.stderr, stderr), name=name)
+                                    tg.create_task(reader(proc.stderr, stderr), name=name, context=named_context(name))
                                 if stdout_cfg is asyncio.subprocess.PIPE:
-                                    tg.create_task(reader(proc.stdout, stdout), name=name)
+                                    tg.create_task(reader(proc.stdout, stdout), name=name, context=named_context(name))
 
                 if proc.returncode is not None:
                     if proc.returncode != 0:
@@ -187,8 +311,8 @@ class base_cli():
     async def dispatch_group(self, task_dicts):
         async with asyncio.TaskGroup() as tg:
             for task_dict in task_dicts:
-                tg.create_task(task_dict['task'],
-                               name=task_dict.get('name', asyncio.current_task().get_name()))
+                name = task_dict.get('name', current_task_name())
+                tg.create_task(task_dict['task'], name=name, context=named_context(name))
     
     async def run_task(self):
         try:
@@ -217,5 +341,10 @@ class base_cli():
             sys.stdout = sys.__stdout__
             sys.stderr = sys.__stderr__
 
+            # write remaining output, the listener leaves the last batch unwritten when stopped mid-batch
+            self._listener.stop()
+            self._writer.flush()
+
     async def run(self):
-        return await asyncio.create_task(self.run_task(), name='MainTask')
+        # named context, output of the main task does not need the task name fallback
+        return await asyncio.create_task(self.run_task(), name='MainTask', context=named_context('MainTask'))
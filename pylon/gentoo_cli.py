@@ -9,7 +9,6 @@ import asyncio
 import email.mime.text
 import getpass
 import io
-import logging
 import pylon
 import smtplib
 import socket
@@ -77,16 +76,18 @@ class gentoo_cli(pylon.base_cli.base_cli):
 
             # add handler for mail logging
             self._mail_stream = io.StringIO()
-            handler = logging.StreamHandler(self._mail_stream)
+            handler = pylon.base_cli.batch_stream_handler(self._writer, self._mail_stream)
             handler.setFormatter(self._formatter)
-            self._logger.addHandler(handler)
+            self.add_log_handler(handler)
             
-            sys.stdout = tee_stringio(sys.stdout, pylon.base_cli.prefixed_stringio(self._mail_stream))
-            sys.stderr = tee_stringio(sys.stderr, pylon.base_cli.prefixed_stringio(self._mail_stream))
+            sys.stdout = tee_stringio(sys.stdout, pylon.base_cli.prefixed_stringio(self._mail_stream, self._queue))
+            sys.stderr = tee_stringio(sys.stderr, pylon.base_cli.prefixed_stringio(self._mail_stream, self._queue))
         
     async def cleanup(self):
         await super().cleanup()
 
+        # mail stream is written by the output listener
+        self.flush_output()
         if (getattr(self.args, 'mail', False) and
             len(self._mail_stream.getvalue()) > 0):
             m = email.mime.text.MIMEText(self._mail_stream.getvalue())